@@ -1,60 +1,203 @@
-from flask import Flask, request, render_template_string, redirect, url_for, flash, send_from_directory, session
+from flask import Flask, Blueprint, current_app, request, render_template_string, redirect, url_for, flash, send_from_directory, session, jsonify
 import os
-from werkzeug.utils import secure_filename
-import requests
-from PIL import Image
-import pytesseract
-import base64
 import json
-import mimetypes
-from dotenv import load_dotenv
-load_dotenv()
+import hashlib
 import logging
-from utils import allowed_file, run_llava_inference, run_text_llm_inference, run_ocr, convert_tiff_to_png, get_mime_type
-from collections import defaultdict
-import fakeredis
+import threading
 import uuid
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import SimpleSpanProcessor, ConsoleSpanExporter
+from werkzeug.utils import secure_filename
+from utils import allowed_file, run_llava_inference, run_text_llm_inference, run_ocr, convert_tiff_to_png, get_mime_type, diff_fields, post_image_json, get_http_session, IMAGE_PLACEHOLDER
+from previews import get_previews
+from dedup import page_fingerprints, is_indexed, indexed_fingerprints, index_document, find_near_duplicates, manifests_match, VERIFY_MAX_CANDIDATES
 
-# Set up OpenTelemetry tracing
-trace.set_tracer_provider(TracerProvider())
-tracer = trace.get_tracer(__name__)
-span_processor = SimpleSpanProcessor(ConsoleSpanExporter())
-trace.get_tracer_provider().add_span_processor(span_processor)
+# Heavy backends (fakeredis, OpenTelemetry SDK, requests, PIL, pytesseract) are
+# imported and created on first use, so importing this module and create_app()
+# stay cheap for workers, tests and CLI tools.
 
 UPLOAD_FOLDER = 'uploads'
+PREVIEW_FOLDER = 'previews'
+# Preview files are named by content hash, so they can be cached forever
+PREVIEW_MAX_AGE = 365 * 24 * 3600
 ALLOWED_EXTENSIONS = {'png', 'tiff', 'tif'}
+# Field diffs are cheap to recompute; expire them so old response pairs don't pile up
+DIFF_CACHE_TTL = 3600
+# How long a near-duplicate suggestion waits for the user to confirm it
+SUGGESTION_TTL = 3600
 
 OLLAMA_API_URL = 'http://localhost:11434/api/generate'
 
 MULTIMODAL_MODELS = ['llava:latest', 'gemma3:27b-vision', 'llama3-vision:latest', 'llama3.2-vision:11b', 'qwen2.5vl:7b', 'llama4:latest']  # Added llama4:latest for vision support
 
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_API_URL = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent'
 GEMINI_FLASH_API_URL = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent'
 GEMINI_PRO_API_URL = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-pro:generateContent'
 
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.secret_key = 'supersecretkey'  # For flash messages
+bp = Blueprint('main', __name__)
+
+_backend_lock = threading.Lock()
+_tracer = None
+_preview_executor = None
+_pending_previews = set()
+
+def create_app(config=None):
+    from dotenv import load_dotenv
+    load_dotenv()
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['PREVIEW_FOLDER'] = PREVIEW_FOLDER
+    app.config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
+    # Opt-in: reuse results of an earlier near-identical document instead of calling the models again
+    app.config['REUSE_NEAR_DUPLICATES'] = os.getenv('REUSE_NEAR_DUPLICATES', '').lower() in ('1', 'true', 'yes')
+    app.secret_key = 'supersecretkey'  # For flash messages
+    if config:
+        app.config.update(config)
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PREVIEW_FOLDER'], exist_ok=True)
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+    # Set up logging
+    logging.basicConfig(level=logging.INFO)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+    app.jinja_env.globals['document_previews'] = document_previews
+    app.register_blueprint(bp)
+    return app
 
-# Use fakeredis for in-memory Redis-like cache
-redis_cache = fakeredis.FakeStrictRedis()
+def get_cache():
+    # Use fakeredis for in-memory Redis-like cache, one per app, created on first use
+    cache = current_app.extensions.get('redis_cache')
+    if cache is None:
+        with _backend_lock:
+            cache = current_app.extensions.get('redis_cache')
+            if cache is None:
+                import fakeredis
+                cache = current_app.extensions['redis_cache'] = fakeredis.FakeStrictRedis()
+    return cache
+
+def get_tracer():
+    # The tracer provider is process-global, so it is installed once on first use
+    global _tracer
+    if _tracer is None:
+        with _backend_lock:
+            if _tracer is None:
+                from opentelemetry import trace
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import SimpleSpanProcessor, ConsoleSpanExporter
+                provider = TracerProvider()
+                provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+                trace.set_tracer_provider(provider)
+                _tracer = trace.get_tracer(__name__)
+    return _tracer
+
+def __getattr__(name):
+    # Keeps `app:app` style entry points working without building the app at import time
+    if name == 'app':
+        global app
+        with _backend_lock:
+            if 'app' not in globals():
+                app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_session_id():
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
     return session['session_id']
 
-@app.route('/', methods=['GET', 'POST'])
+def document_manifest(filename, build=True):
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+    return get_previews(filepath, current_app.config['PREVIEW_FOLDER'], get_cache(), current_app.config['UPLOAD_FOLDER'], build=build)
+
+def render_previews_later(filename):
+    # Renders off the request thread, at most one job per file at a time
+    global _preview_executor
+    filepath = os.path.abspath(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
+    with _backend_lock:
+        if filepath in _pending_previews:
+            return None
+        _pending_previews.add(filepath)
+        if _preview_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _preview_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='previews')
+    args = (filepath, current_app.config['PREVIEW_FOLDER'], get_cache(), current_app.config['UPLOAD_FOLDER'])
+
+    def render():
+        try:
+            get_previews(*args)
+        finally:
+            with _backend_lock:
+                _pending_previews.discard(filepath)
+    return _preview_executor.submit(render)
+
+def document_previews(filename):
+    # Listings never decode originals: files uploaded before previews existed are
+    # rendered in the background and shown as plain links until they are ready
+    manifest = document_manifest(filename, build=False)
+    if not manifest:
+        render_previews_later(filename)
+        return []
+    return [
+        {
+            'preview': url_for('main.preview_file', name=page['preview']),
+            'thumbnail': url_for('main.preview_file', name=page['thumbnail']),
+        }
+        for page in manifest['pages']
+    ]
+
+def document_fingerprints(filename):
+    # Perceptual fingerprints of every page, (re)indexed for near-duplicate lookups
+    manifest = document_manifest(filename)
+    if not manifest:
+        return []
+    try:
+        fingerprints = page_fingerprints(manifest, current_app.config['PREVIEW_FOLDER'])
+    except Exception as e:
+        logging.error(f"Fingerprinting failed for {filename}: {e}")
+        return []
+    index_document(get_cache(), filename, fingerprints)
+    return fingerprints
+
+def near_duplicate_result(redis_cache, user_session_id, filename, combo):
+    fingerprints = indexed_fingerprints(redis_cache, filename)
+    if fingerprints is None:
+        fingerprints = document_fingerprints(filename)
+    manifest = None
+    compared = 0
+    for distance, other in find_near_duplicates(redis_cache, fingerprints, exclude=filename):
+        cached = redis_cache.get(f"{user_session_id}:{other}::{combo}")
+        if not cached:
+            continue
+        if compared == VERIFY_MAX_CANDIDATES:
+            break
+        compared += 1
+        # The hash only shortlists candidates; filled copies of one form hash alike,
+        # so the rendered pages must actually match before a result is reused
+        manifest = manifest or document_manifest(filename)
+        other_manifest = document_manifest(other)
+        if not manifest or not other_manifest or not manifests_match(redis_cache, manifest, other_manifest, current_app.config['PREVIEW_FOLDER']):
+            continue
+        cached_obj = json.loads(cached)
+        # Point at the document the result was originally computed for
+        cached_obj['reused_from'] = cached_obj.get('reused_from') or other
+        cached_obj['filename'] = filename
+        logging.info(f"Suggesting {combo} result of {cached_obj['reused_from']} for near-duplicate {filename} (distance {distance})")
+        return json.dumps(cached_obj)
+    return None
+
+def suggestion_key(cache_key):
+    return f"suggested:{cache_key}"
+
+def confirm_suggestion(redis_cache, user_session_id, cache_key):
+    # Promotes a near-duplicate suggestion to this document's result
+    if not cache_key.startswith(f"{user_session_id}:"):
+        return False
+    suggestion = redis_cache.get(suggestion_key(cache_key))
+    if not suggestion:
+        return False
+    redis_cache.set(cache_key, suggestion)
+    redis_cache.delete(suggestion_key(cache_key))
+    return True
+
+@bp.route('/', methods=['GET', 'POST'])
 def upload_file():
     try:
         if request.method == 'POST':
@@ -67,8 +210,10 @@ def upload_file():
                 return redirect(request.url)
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
                 file.save(filepath)
+                # Render previews and fingerprints once at upload so later pages never decode the original
+                document_fingerprints(filename)
                 return render_template_string('''
                     <!doctype html>
                     <title>Choose Parsing Method</title>
@@ -90,7 +235,7 @@ def upload_file():
             else:
                 flash('Invalid file type. Only PNG and TIFF are allowed.')
                 return redirect(request.url)
-        files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if allowed_file(f)]
+        files = [f for f in os.listdir(current_app.config['UPLOAD_FOLDER']) if allowed_file(f)]
         return render_template_string('''
             <!doctype html>
             <title>Upload TIFF/PNG File</title>
@@ -112,7 +257,11 @@ def upload_file():
             <h2>Files in Uploads Folder</h2>
             <ul>
             {% for file in files %}
-              <li><a href="/uploads/{{ file }}" target="_blank">{{ file }}</a></li>
+              {% set pages = document_previews(file) %}
+              <li>
+                {% if pages %}<img src="{{ pages[0].thumbnail }}" alt="" loading="lazy" style="max-width: 64px; max-height: 64px; vertical-align: middle;">{% endif %}
+                <a href="/uploads/{{ file }}" target="_blank">{{ file }}</a>
+              </li>
             {% else %}
               <li>No files uploaded yet.</li>
             {% endfor %}
@@ -124,13 +273,21 @@ def upload_file():
         flash('An unexpected error occurred during file upload.')
         return redirect(request.url)
 
-@app.route('/uploads/<filename>')
+@bp.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+
+@bp.route('/previews/<name>')
+def preview_file(name):
+    # send_from_directory handles ETag/If-None-Match and Range requests
+    response = send_from_directory(current_app.config['PREVIEW_FOLDER'], name, max_age=PREVIEW_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
 
-@app.route('/documents', methods=['GET', 'POST'])
+@bp.route('/documents', methods=['GET', 'POST'])
 def list_documents():
-    files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if allowed_file(f)]
+    redis_cache = get_cache()
+    files = [f for f in os.listdir(current_app.config['UPLOAD_FOLDER']) if allowed_file(f)]
     combinations = [
         ('ocr', 'OCR Only'),
         ('llava', 'LLaVA Only'),
@@ -150,6 +307,7 @@ def list_documents():
     llm_requests = {}
     llm_responses = {}
     compare_keys = []
+    reuse_near_duplicates = current_app.config['REUSE_NEAR_DUPLICATES']
     if request.method == 'POST':
         # Detect if this is a compare POST (dropdowns present)
         is_compare = 'left_select' in request.form or 'right_select' in request.form
@@ -161,23 +319,40 @@ def list_documents():
         else:
             selected_files = request.form.getlist('files')
             selected_combos = request.form.getlist('combos')
+        # Only files that are actually listed in the upload folder can be processed
+        selected_files = [f for f in selected_files if f in files and secure_filename(f) == f]
+        reuse_near_duplicates = request.form.get('reuse_near_duplicates') == 'on'
         user_session_id = get_session_id()
+        for cache_key in request.form.getlist('confirm'):
+            confirm_suggestion(redis_cache, user_session_id, cache_key)
         for filename in selected_files:
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            # Uploads are indexed already; only pick up files that predate the index
+            if not is_compare and not is_indexed(redis_cache, filename):
+                document_fingerprints(filename)
             for combo in selected_combos:
                 cache_key = f"{user_session_id}:{filename}::{combo}"
                 cached = redis_cache.get(cache_key)
+                suggested = False
+                if not cached and reuse_near_duplicates:
+                    cached = near_duplicate_result(redis_cache, user_session_id, filename, combo)
+                    if cached:
+                        # Shown but not stored as this document's result until the user
+                        # confirms it: a single changed digit can pass the page comparison
+                        redis_cache.set(suggestion_key(cache_key), cached, ex=SUGGESTION_TTL)
+                        suggested = True
                 if cached:
                     cached_obj = json.loads(cached)
                     req = cached_obj.get('request', '')
                     resp = cached_obj.get('response', '')
                     trace_id = cached_obj.get('trace_id')
+                    reused_from = cached_obj.get('reused_from')
                     # Ensure request is always present in cache (backfill if missing)
-                    if not cached_obj.get('request'):
+                    if not cached_obj.get('request') and not suggested:
                         redis_cache.set(cache_key, json.dumps({'request': req, 'response': resp, 'filename': filename, 'combo': combo, 'trace_id': trace_id}))
                 else:
-                    req, resp, trace_id = '', '', None
-                    with tracer.start_as_current_span(f"LLM-{combo}") as span:
+                    req, resp, trace_id, reused_from = '', '', None, None
+                    with get_tracer().start_as_current_span(f"LLM-{combo}") as span:
                         span.set_attribute("filename", filename)
                         if combo == 'ocr':
                             req = f"OCR on {filename}"
@@ -228,9 +403,6 @@ def list_documents():
                                 req = f"Attempted image inference with {model_name} on {filename}"
                             else:
                                 try:
-                                    with open(filepath, 'rb') as img_file:
-                                        image_bytes = img_file.read()
-                                        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
                                     req = json.dumps({
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
@@ -240,9 +412,9 @@ def list_documents():
                                     data = {
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
-                                        'image': image_b64
+                                        'image': IMAGE_PLACEHOLDER
                                     }
-                                    response = requests.post(OLLAMA_API_URL, json=data, stream=True)
+                                    response = post_image_json(OLLAMA_API_URL, data, filepath, stream=True)
                                     if response.ok:
                                         result = ''
                                         for line in response.iter_lines():
@@ -266,9 +438,6 @@ def list_documents():
                                 req = f"Attempted image inference with {model_name} on {filename}"
                             else:
                                 try:
-                                    with open(filepath, 'rb') as img_file:
-                                        image_bytes = img_file.read()
-                                        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
                                     req = json.dumps({
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
@@ -278,9 +447,9 @@ def list_documents():
                                     data = {
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
-                                        'images': [image_b64]
+                                        'images': [IMAGE_PLACEHOLDER]
                                     }
-                                    response = requests.post(OLLAMA_API_URL, json=data, stream=True)
+                                    response = post_image_json(OLLAMA_API_URL, data, filepath, stream=True)
                                     if response.ok:
                                         result = ''
                                         for line in response.iter_lines():
@@ -304,9 +473,6 @@ def list_documents():
                                 req = f"Attempted image inference with {model_name} on {filename}"
                             else:
                                 try:
-                                    with open(filepath, 'rb') as img_file:
-                                        image_bytes = img_file.read()
-                                        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
                                     req = json.dumps({
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
@@ -316,9 +482,9 @@ def list_documents():
                                     data = {
                                         'model': model_name,
                                         'prompt': 'Describe the contents of this image and extract relevant fields as a markdown table.',
-                                        'images': [image_b64]
+                                        'images': [IMAGE_PLACEHOLDER]
                                     }
-                                    response = requests.post(OLLAMA_API_URL, json=data, stream=True)
+                                    response = post_image_json(OLLAMA_API_URL, data, filepath, stream=True)
                                     if response.ok:
                                         result = ''
                                         for line in response.iter_lines():
@@ -352,7 +518,7 @@ def list_documents():
                                     'prompt': prompt
                                 }
                                 try:
-                                    response = requests.post(OLLAMA_API_URL, json=data, stream=True)
+                                    response = get_http_session().post(OLLAMA_API_URL, json=data, stream=True)
                                     if response.ok:
                                         result = ''
                                         for line in response.iter_lines():
@@ -377,9 +543,6 @@ def list_documents():
                                 req = f"Attempted image inference with {model_name} on {filename}"
                             else:
                                 try:
-                                    with open(filepath, 'rb') as img_file:
-                                        image_bytes = img_file.read()
-                                        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
                                     req = json.dumps({
                                         'model': model_name,
                                         'prompt': 'Extract all fields and tables from this document as markdown.',
@@ -389,9 +552,9 @@ def list_documents():
                                     data = {
                                         'model': model_name,
                                         'prompt': 'Extract all fields and tables from this document as markdown.',
-                                        'images': [image_b64]
+                                        'images': [IMAGE_PLACEHOLDER]
                                     }
-                                    response = requests.post(OLLAMA_API_URL, json=data, stream=True)
+                                    response = post_image_json(OLLAMA_API_URL, data, filepath, stream=True)
                                     if response.ok:
                                         result = ''
                                         for line in response.iter_lines():
@@ -409,7 +572,7 @@ def list_documents():
                                     resp = f"Error: {e}"
                             span.set_attribute("llm.response", resp)
                         elif combo in ('img_gemini_flash', 'img_gemini_pro'):
-                            if not GEMINI_API_KEY:
+                            if not current_app.config['GEMINI_API_KEY']:
                                 resp = 'Gemini API key not set.'
                                 req = 'Gemini API key not set.'
                             else:
@@ -423,11 +586,8 @@ def list_documents():
                                     image_path_for_gemini = filepath
                                 try:
                                     mime_type = get_mime_type(image_path_for_gemini)
-                                    with open(image_path_for_gemini, 'rb') as img_file:
-                                        image_bytes = img_file.read()
-                                        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
                                     headers = {'Content-Type': 'application/json'}
-                                    params = {'key': GEMINI_API_KEY}
+                                    params = {'key': current_app.config['GEMINI_API_KEY']}
                                     data = {
                                         'contents': [
                                             {
@@ -446,10 +606,10 @@ def list_documents():
                                         'data': data
                                     }
                                     req = json.dumps(req_data, indent=2)
-                                    # Now set the actual data with the real base64 for the request
-                                    data['contents'][0]['parts'][1]['inlineData']['data'] = image_b64
+                                    # The image is base64-encoded straight into the request body as it is sent
+                                    data['contents'][0]['parts'][1]['inlineData']['data'] = IMAGE_PLACEHOLDER
                                     api_url = GEMINI_FLASH_API_URL if combo == 'img_gemini_flash' else GEMINI_PRO_API_URL
-                                    response = requests.post(api_url, headers=headers, params=params, json=data)
+                                    response = post_image_json(api_url, data, image_path_for_gemini, headers=headers, params=params)
                                     label = combinations[[c[0] for c in combinations].index(combo)][1]
                                     if response.ok:
                                         try:
@@ -477,8 +637,8 @@ def list_documents():
                     redis_cache.set(cache_key, json.dumps({'request': req, 'response': resp, 'filename': filename, 'combo': combo, 'trace_id': trace_id}))
                 llm_requests[cache_key] = req
                 llm_responses[cache_key] = resp
-                results.append({'filename': filename, 'combo': combo, 'request': req, 'response': resp, 'trace_id': trace_id})
-        compare_keys = [f"{user_session_id}:{r['filename']}::{r['combo']}" for r in results]
+                results.append({'filename': filename, 'combo': combo, 'request': req, 'response': resp, 'trace_id': trace_id, 'reused_from': reused_from, 'suggested': suggested, 'cache_key': cache_key})
+        compare_keys = [r['cache_key'] for r in results if not r['suggested']]
     # Get dropdowns: collect all cache_keys for this POST
     left_sel = request.form.get('left_select')
     right_sel = request.form.get('right_select')
@@ -534,6 +694,12 @@ def list_documents():
         <h1>Uploaded Documents</h1>
         <form method="post">
             <label>Select files:</label><br>
+            <div style="display: flex; gap: 0.5em; flex-wrap: wrap; margin-bottom: 0.5em;">
+                {% for file in files %}
+                {% set pages = document_previews(file) %}
+                {% if pages %}<img src="{{ pages[0].thumbnail }}" alt="{{ file }}" title="{{ file }}" loading="lazy" style="max-width: 64px; max-height: 64px; border: 1px solid #ccc;">{% endif %}
+                {% endfor %}
+            </div>
             <select name="files" multiple size="5" style="width: 300px;">
                 {% for file in files %}
                 <option value="{{ file }}" {% if file in selected_files %}selected{% endif %}>{{ file }}</option>
@@ -544,13 +710,21 @@ def list_documents():
                 <input type="checkbox" name="combos" value="{{ combo }}" {% if combo in selected_combos %}checked{% endif %}> {{ label }}<br>
             {% endfor %}
             <br>
+            <input type="checkbox" name="reuse_near_duplicates" {% if reuse_near_duplicates %}checked{% endif %}> Reuse results from near-duplicate pages (rescans/faxes of an already processed document)<br>
+            <br>
             <input type="submit" value="Process">
         </form>
         <hr>
         {% if results|length > 0 %}
             <h2>Document</h2>
             <div style="max-height: 500px; overflow-y: auto; border: 1px solid #ccc; border-radius: 5px; background: inherit; padding: 0.5em; display: flex; justify-content: center; align-items: center;">
-                <img src="/uploads/{{ results[0].filename }}" alt="Document Image" style="max-width: 100%; max-height: 480px; border: 1px solid #ccc; display: block; margin: 0 auto; background: #fff;"/>
+                <div>
+                {% for page in document_previews(results[0].filename) %}
+                    <img src="{{ page.preview }}" alt="Document Image" loading="lazy" style="max-width: 100%; max-height: 480px; border: 1px solid #ccc; display: block; margin: 0 auto 0.5em; background: #fff;"/>
+                {% else %}
+                    <a href="/uploads/{{ results[0].filename }}" target="_blank">{{ results[0].filename }}</a>
+                {% endfor %}
+                </div>
             </div>
             <hr>
         {% endif %}
@@ -560,6 +734,21 @@ def list_documents():
                 <div style="flex: 1; min-width: 300px; max-height: 400px; overflow-y: auto; border: 1px solid #ccc; padding: 0.5em; border-radius: 5px; background: inherit; margin-bottom: 0.5em;">
                     <h3>Request Sent to LLM</h3>
                     <pre style="background: inherit; padding: 1em; border-radius: 5px; white-space: pre-wrap; max-height: 350px; overflow-y: auto;">{{ r.request }}</pre>
+                    {% if r.suggested %}
+                        <h3>Suggested Result (not confirmed)</h3>
+                        <p>Copied from near-duplicate {{ r.reused_from }}; no model call was made. Check it against this document first: a copy with a single changed digit or letter can look like a rescan.</p>
+                        <form method="post">
+                            {% for f in selected_files %}<input type="hidden" name="files" value="{{ f }}">{% endfor %}
+                            {% for c in selected_combos %}<input type="hidden" name="combos" value="{{ c }}">{% endfor %}
+                            <input type="hidden" name="reuse_near_duplicates" value="on">
+                            <input type="hidden" name="confirm" value="{{ r.cache_key }}">
+                            <input type="submit" value="Confirm and keep this result">
+                        </form>
+                        <p>To run the models instead, process again with near-duplicate reuse unchecked.</p>
+                    {% elif r.reused_from %}
+                        <h3>Reused Result</h3>
+                        <p>Confirmed copy of the result for near-duplicate {{ r.reused_from }}; no model call was made.</p>
+                    {% endif %}
                     {% if r.trace_id %}
                         <h3>Trace ID</h3>
                         <p style="max-height: 50px; overflow-y: auto;">{{ r.trace_id }}</p>
@@ -574,9 +763,10 @@ def list_documents():
         {% endfor %}
         {% if results|length > 1 %}
         <h2>Compare LLM Parsed Responses</h2>
-        <form method="post">
+        <form method="post" id="compare-form">
             <input type="hidden" name="files" value="{{ selected_files|join(',') }}">
             <input type="hidden" name="combos" value="{{ selected_combos|join(',') }}">
+            {% if reuse_near_duplicates %}<input type="hidden" name="reuse_near_duplicates" value="on">{% endif %}
             <label>Left:</label>
             <select name="left_select">
                 {% for k in compare_keys %}
@@ -594,21 +784,101 @@ def list_documents():
         <div style="display: flex; gap: 2em;">
             <div style="flex: 1; max-height: 400px; overflow-y: auto; border: 1px solid #ccc; padding: 0.5em; border-radius: 5px; background: inherit;">
                 <h3>Left Parsed Response</h3>
-                <pre style="background: inherit; padding: 1em; border-radius: 5px; white-space: pre-wrap; max-height: 350px; overflow-y: auto;">{{ left_resp|safe }}</pre>
+                <pre id="left-resp" style="background: inherit; padding: 1em; border-radius: 5px; white-space: pre-wrap; max-height: 350px; overflow-y: auto;">{{ left_resp|safe }}</pre>
             </div>
             <div style="flex: 1; max-height: 400px; overflow-y: auto; border: 1px solid #ccc; padding: 0.5em; border-radius: 5px; background: inherit;">
                 <h3>Right Parsed Response</h3>
-                <pre style="background: inherit; padding: 1em; border-radius: 5px; white-space: pre-wrap; max-height: 350px; overflow-y: auto;">{{ right_resp|safe }}</pre>
+                <pre id="right-resp" style="background: inherit; padding: 1em; border-radius: 5px; white-space: pre-wrap; max-height: 350px; overflow-y: auto;">{{ right_resp|safe }}</pre>
             </div>
         </div>
+        <h3>Field Differences</h3>
+        <table id="compare-diff" border="1" cellpadding="4" style="border-collapse: collapse; margin-bottom: 1em;">
+            <thead><tr><th>Field</th><th>Left</th><th>Right</th><th>Status</th></tr></thead>
+            <tbody></tbody>
+        </table>
+        <script>
+            (function () {
+                var form = document.getElementById('compare-form');
+                var left = form.elements['left_select'];
+                var right = form.elements['right_select'];
+                var statusColors = {changed: '#f6d365', left_only: '#f5a3a3', right_only: '#a3d3f5'};
+                function cell(row, text) {
+                    var td = document.createElement('td');
+                    td.textContent = text === null ? '' : text;
+                    row.appendChild(td);
+                }
+                function compare() {
+                    var url = '/compare?left=' + encodeURIComponent(left.value) + '&right=' + encodeURIComponent(right.value);
+                    fetch(url, {credentials: 'same-origin'})
+                        .then(function (r) { return r.json(); })
+                        .then(function (data) {
+                            var tbody = document.querySelector('#compare-diff tbody');
+                            tbody.innerHTML = '';
+                            if (data.error) {
+                                document.getElementById('left-resp').textContent = data.error;
+                                document.getElementById('right-resp').textContent = '';
+                                return;
+                            }
+                            document.getElementById('left-resp').textContent = data.left.response;
+                            document.getElementById('right-resp').textContent = data.right.response;
+                            data.diff.forEach(function (d) {
+                                var row = document.createElement('tr');
+                                if (statusColors[d.status]) {
+                                    row.style.background = statusColors[d.status];
+                                    row.style.color = '#222';
+                                }
+                                cell(row, d.field);
+                                cell(row, d.left);
+                                cell(row, d.right);
+                                cell(row, d.status.replace('_', ' '));
+                                tbody.appendChild(row);
+                            });
+                        });
+                }
+                form.addEventListener('submit', function (e) { e.preventDefault(); compare(); });
+                left.addEventListener('change', compare);
+                right.addEventListener('change', compare);
+                compare();
+            })();
+        </script>
         {% endif %}
         <a href="/">Back to upload</a>
-    ''', files=files, combinations=combinations, results=results, selected_files=selected_files, selected_combos=selected_combos, compare_keys=compare_keys, left_sel=left_sel, right_sel=right_sel, left_resp=left_resp, right_resp=right_resp)
+    ''', files=files, combinations=combinations, results=results, selected_files=selected_files, selected_combos=selected_combos, compare_keys=compare_keys, left_sel=left_sel, right_sel=right_sel, left_resp=left_resp, right_resp=right_resp, reuse_near_duplicates=reuse_near_duplicates)
 
-@app.route('/parse/llava', methods=['POST'])
+@bp.route('/compare')
+def compare_results():
+    # Fetches only the two selected results; the field diff is computed once per pair
+    left_key = request.args.get('left', '')
+    right_key = request.args.get('right', '')
+    prefix = f"{get_session_id()}:"
+    if not left_key.startswith(prefix) or not right_key.startswith(prefix):
+        return jsonify({'error': 'Unknown result key.'}), 404
+    redis_cache = get_cache()
+    left_cached, right_cached = redis_cache.mget([left_key, right_key])
+    if not left_cached or not right_cached:
+        return jsonify({'error': 'Result not found. Process the document first.'}), 404
+    left_resp = json.loads(left_cached).get('response', '')
+    right_resp = json.loads(right_cached).get('response', '')
+    # Keyed by content, so a result replaced under the same key never serves a stale diff
+    left_hash = hashlib.sha256(left_resp.encode('utf-8')).hexdigest()
+    right_hash = hashlib.sha256(right_resp.encode('utf-8')).hexdigest()
+    diff_key = f"compare:{left_hash}:{right_hash}"
+    cached_diff = redis_cache.get(diff_key)
+    if cached_diff:
+        diff = json.loads(cached_diff)
+    else:
+        diff = diff_fields(left_resp, right_resp)
+        redis_cache.set(diff_key, json.dumps(diff), ex=DIFF_CACHE_TTL)
+    return jsonify({
+        'left': {'key': left_key, 'response': left_resp},
+        'right': {'key': right_key, 'response': right_resp},
+        'diff': diff,
+    })
+
+@bp.route('/parse/llava', methods=['POST'])
 def parse_llava():
     filename = request.form['filename']
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
     try:
         result = run_llava_inference(filepath, OLLAMA_API_URL)
         return render_template_string('''
@@ -621,10 +891,10 @@ def parse_llava():
         flash('An unexpected error occurred during LLaVA parsing.')
         return redirect(request.url)
 
-@app.route('/parse/ocr_gemma3', methods=['POST'])
+@bp.route('/parse/ocr_gemma3', methods=['POST'])
 def parse_ocr_gemma3():
     filename = request.form['filename']
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
     try:
         ocr_text = run_ocr(filepath)
         if not ocr_text:
@@ -645,7 +915,11 @@ def parse_ocr_gemma3():
         # Display the image and the parsed result below
         return render_template_string('''
             <h2>Scanned Image</h2>
-            <img src="/uploads/{{ filename }}" alt="Scanned Image" style="max-width: 100%; height: auto; border: 1px solid #ccc; margin-bottom: 20px;"/>
+            {% for page in document_previews(filename) %}
+            <img src="{{ page.preview }}" alt="Scanned Image" style="max-width: 100%; height: auto; border: 1px solid #ccc; margin-bottom: 20px;"/>
+            {% else %}
+            <a href="/uploads/{{ filename }}" target="_blank">{{ filename }}</a>
+            {% endfor %}
             <h2>OCR Extracted Text</h2>
             <pre style="background: #f0f0f0; padding: 1em; border-radius: 5px;">{{ ocr_text }}</pre>
             <h2>Parsed Document (Table or Structured Data)</h2>
@@ -657,10 +931,10 @@ def parse_ocr_gemma3():
         flash('An unexpected error occurred during OCR + Gemma3 parsing.')
         return redirect(request.url)
 
-@app.route('/parse/ocr_llama3', methods=['POST'])
+@bp.route('/parse/ocr_llama3', methods=['POST'])
 def parse_ocr_llama3():
     filename = request.form['filename']
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
     try:
         ocr_text = run_ocr(filepath)
         if not ocr_text:
@@ -678,4 +952,4 @@ def parse_ocr_llama3():
         return redirect(request.url)
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Cold import and app-factory time for the app's modules, each measured in a fresh
+# interpreter, plus which heavy dependencies each import drags in.
+#
+#   python benchmarks/bench_import_time.py --repeat 5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['flask', 'requests', 'PIL', 'pytesseract', 'fakeredis', 'opentelemetry.sdk.trace']
+
+TARGETS = [
+    ('import utils', 'import utils'),
+    ('import previews', 'import previews'),
+    ('import app', 'import app'),
+    ('create_app()', 'import app; app.create_app()'),
+]
+
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': heavy}}))
+'''
+
+def measure(code):
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE.format(code=code, heavy=HEAVY_MODULES)],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold import time of the app modules')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'target':<18} {'best ms':>9} {'median ms':>10}  heavy modules loaded")
+    for label, code in TARGETS:
+        runs = [measure(code) for _ in range(args.repeat)]
+        times = sorted(r['ms'] for r in runs)
+        heavy = ', '.join(runs[-1]['heavy']) or '-'
+        print(f"{label:<18} {times[0]:>9.1f} {times[len(times) // 2]:>10.1f}  {heavy}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import base64
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import post_image_json, IMAGE_PLACEHOLDER
+
+# Peak RSS per concurrent vision request: the old "read, b64encode, json=" path
+# versus the streaming Base64JSONBody. Each mode runs in its own process because
+# ru_maxrss is a lifetime high-water mark.
+#
+#   python benchmarks/bench_request_memory.py --size-mb 20 --concurrency 8
+
+class DrainHandler(BaseHTTPRequestHandler):
+    # Delay before reading so every client has its body in flight at the same time
+    delay = 0.5
+
+    def do_POST(self):
+        threading.Event().wait(self.delay)
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+def baseline_request(url, image_path):
+    with open(image_path, 'rb') as img_file:
+        image_bytes = img_file.read()
+        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+    data = {'model': 'bench', 'prompt': 'bench', 'images': [image_b64]}
+    return requests.post(url, json=data)
+
+def streaming_request(url, image_path):
+    data = {'model': 'bench', 'prompt': 'bench', 'images': [IMAGE_PLACEHOLDER]}
+    return post_image_json(url, data, image_path)
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def run_worker(mode, image_path, concurrency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DrainHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    send = baseline_request if mode == 'baseline' else streaming_request
+    # Warm up imports and connection machinery before taking the starting mark
+    send(url, __file__)
+    start_rss = max_rss_mb()
+    threads = [threading.Thread(target=send, args=(url, image_path)) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    peak_rss = max_rss_mb()
+    print(json.dumps({'mode': mode, 'start_rss_mb': start_rss, 'peak_rss_mb': peak_rss}))
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak RSS per concurrent vision request')
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--worker', choices=['baseline', 'streaming'])
+    parser.add_argument('--image')
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.image, args.concurrency)
+        return
+
+    with tempfile.NamedTemporaryFile(suffix='.tif', delete=False) as f:
+        # Random bytes compress like a scanned image would; content does not matter here
+        f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+        image_path = f.name
+    try:
+        print(f"image: {args.size_mb:.1f} MB, concurrency: {args.concurrency}")
+        print(f"{'mode':<10} {'start MB':>10} {'peak MB':>10} {'per request MB':>15}")
+        for mode in ('baseline', 'streaming'):
+            out = subprocess.run(
+                [sys.executable, __file__, '--worker', mode, '--image', image_path,
+                 '--concurrency', str(args.concurrency)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            per_request = (result['peak_rss_mb'] - result['start_rss_mb']) / args.concurrency
+            print(f"{mode:<10} {result['start_rss_mb']:>10.1f} {result['peak_rss_mb']:>10.1f} {per_request:>15.1f}")
+    finally:
+        os.remove(image_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import os
+import json
+import math
+import logging
+
+# Near-duplicate detection for document pages. Rescans and re-faxes of the same
+# page have different bytes, so a perceptual hash (pHash) of each page feeds a
+# banded index that cheaply finds candidates. Filled-in copies of the same form
+# hash alike too, so every candidate is then confirmed by comparing the stored
+# previews block by block before any result is reused.
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DCT_SIZE = 32
+# Max Hamming distance (out of 64 bits) for a page to be a near-duplicate candidate
+NEAR_DUPLICATE_DISTANCE = 8
+# Pigeonhole: with distance + 1 bands, any two hashes within the distance agree
+# exactly on at least one band, so exact band lookups find every candidate
+BAND_COUNT = NEAR_DUPLICATE_DISTANCE + 1
+# Pages whose thumbnail spans fewer gray levels than this are treated as blank
+FLAT_RANGE = 16
+# Hashes with fewer set (or unset) bits than this carry too little information to index
+MIN_HASH_BITS = 8
+
+# Preview comparison: pages are compared at VERIFY_WIDTH px in VERIFY_BLOCK px
+# blocks, each block searching +/- VERIFY_SEARCH px for its best alignment
+VERIFY_WIDTH = 800
+VERIFY_BLOCK = 40
+VERIFY_SEARCH = 8
+VERIFY_BLUR = 1.5
+# A page matches only if its worst block's unexplained ink variance (x1000) is
+# below VERIFY_MAX_RESIDUAL and at most VERIFY_MAX_RATIO times the page's typical
+# text block. Rescans degrade every block a little; a different name or amount
+# is a local outlier. Heavily degraded copies fail too, which is the safe side.
+VERIFY_MAX_RESIDUAL = 12.0
+VERIFY_MAX_RATIO = 3.8
+VERIFY_MAX_ASPECT_DIFF = 0.03
+# Each first-time page comparison costs about 0.8 s at preview size and runs in
+# the request. Filled copies of one form all share buckets, so only this many
+# of the closest candidates are ever compared for one lookup.
+VERIFY_MAX_CANDIDATES = 3
+
+_DCT = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * DCT_SIZE)) for x in range(DCT_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+def phash(image):
+    from PIL import Image, ImageOps
+    small = image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS)
+    lo, hi = small.getextrema()
+    if hi - lo < FLAT_RANGE:
+        return 0
+    pixels = ImageOps.autocontrast(small).tobytes()
+    rows = [pixels[y * DCT_SIZE:(y + 1) * DCT_SIZE] for y in range(DCT_SIZE)]
+    # Low-frequency HASH_SIZE x HASH_SIZE corner of the 2-D DCT-II
+    partial = [[sum(c * p for c, p in zip(_DCT[u], row)) for row in rows] for u in range(HASH_SIZE)]
+    coeffs = [sum(c * p for c, p in zip(_DCT[v], partial[u])) for v in range(HASH_SIZE) for u in range(HASH_SIZE)]
+    median = sorted(coeffs[1:])[len(coeffs[1:]) // 2]
+    value = 0
+    for coeff in coeffs:
+        value = (value << 1) | (coeff > median)
+    return value
+
+def format_hash(value):
+    return f"{value:0{HASH_BITS // 4}x}"
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def is_informative(value):
+    # Blank and near-uniform pages all hash to (nearly) all-zero/all-one values
+    ones = bin(value).count('1')
+    return MIN_HASH_BITS <= ones <= HASH_BITS - MIN_HASH_BITS
+
+def page_fingerprints(manifest, preview_dir):
+    # Hashes are stored in the preview manifest at upload time; older manifests
+    # get them computed from their (already small) thumbnails
+    if manifest.get('phashes'):
+        return [int(h, 16) for h in manifest['phashes']]
+    from PIL import Image
+    fingerprints = []
+    for page in manifest['pages']:
+        with Image.open(os.path.join(preview_dir, page['thumbnail'])) as thumb:
+            fingerprints.append(phash(thumb))
+    return fingerprints
+
+def _bands(value):
+    bounds = [i * HASH_BITS // BAND_COUNT for i in range(BAND_COUNT + 1)]
+    return [(value >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in zip(bounds, bounds[1:])]
+
+def _band_key(band, value):
+    return f"phash:band:{band}:{value:x}"
+
+def _doc_key(filename):
+    return f"phash:doc:{filename}"
+
+def is_indexed(cache, filename):
+    return bool(cache.exists(_doc_key(filename)))
+
+def indexed_fingerprints(cache, filename):
+    stored = cache.get(_doc_key(filename))
+    if stored is None:
+        return None
+    return [int(h, 16) for h in json.loads(stored)]
+
+def index_document(cache, filename, fingerprints):
+    entry = json.dumps([format_hash(h) for h in fingerprints])
+    previous = cache.get(_doc_key(filename))
+    if previous is not None and previous.decode('utf-8') == entry:
+        return
+    if previous is not None and json.loads(previous):
+        old_first = int(json.loads(previous)[0], 16)
+        for band, value in enumerate(_bands(old_first)):
+            cache.srem(_band_key(band, value), filename)
+    cache.set(_doc_key(filename), entry)
+    # Documents are bucketed by their first page; blank first pages are recorded
+    # as indexed but never bucketed, so they cannot match each other
+    if fingerprints and is_informative(fingerprints[0]):
+        for band, value in enumerate(_bands(fingerprints[0])):
+            cache.sadd(_band_key(band, value), filename)
+
+def find_near_duplicates(cache, fingerprints, max_distance=NEAR_DUPLICATE_DISTANCE, exclude=None):
+    # Candidate filter only: returns [(distance, filename), ...] closest first,
+    # where distance is the worst page's. Confirm with pages_match before reuse.
+    if not fingerprints or not is_informative(fingerprints[0]):
+        return []
+    max_distance = min(max_distance, NEAR_DUPLICATE_DISTANCE)
+    candidates = set()
+    for band, value in enumerate(_bands(fingerprints[0])):
+        candidates.update(m.decode('utf-8') for m in cache.smembers(_band_key(band, value)))
+    candidates.discard(exclude)
+    matches = []
+    candidates = sorted(candidates)
+    for filename, stored in zip(candidates, cache.mget([_doc_key(c) for c in candidates])):
+        if stored is None:
+            continue
+        other = [int(h, 16) for h in json.loads(stored)]
+        if len(other) != len(fingerprints):
+            continue
+        distance = max(hamming_distance(a, b) for a, b in zip(fingerprints, other))
+        if distance <= max_distance:
+            matches.append((distance, filename))
+    return sorted(matches)
+
+def _ink(image, height=None):
+    import numpy as np
+    from PIL import Image, ImageFilter, ImageOps
+    gray = image.convert('L')
+    height = height or round(gray.height * VERIFY_WIDTH / gray.width)
+    gray = gray.resize((VERIFY_WIDTH, height), Image.LANCZOS)
+    gray = ImageOps.autocontrast(gray, cutoff=1).filter(ImageFilter.MedianFilter(3))
+    ink = ImageOps.invert(gray).filter(ImageFilter.GaussianBlur(VERIFY_BLUR))
+    return np.asarray(ink, dtype=np.float64) / 255
+
+def _block_sums(values, block):
+    rows, cols = values.shape[0] // block, values.shape[1] // block
+    return values[:rows * block, :cols * block].reshape(rows, block, cols, block).sum(axis=(1, 3))
+
+def page_residuals(image_a, image_b):
+    # Per block of image_a: the ink variance of both blocks left unexplained by
+    # their best-correlated alignment within +/- VERIFY_SEARCH px, scaled x1000
+    import numpy as np
+    a = _ink(image_a)
+    b = _ink(image_b, height=a.shape[0])
+    block, search = VERIFY_BLOCK, VERIFY_SEARCH
+    h, w = a.shape[0] - a.shape[0] % block, a.shape[1] - a.shape[1] % block
+    a = a[:h, :w]
+    n = block * block
+    sum_a = _block_sums(a, block)
+    var_a = _block_sums(a * a, block) - sum_a * sum_a / n
+    padded = np.pad(b, search)
+    # Integral images give B's block sums at any offset without re-summing
+    integral = np.pad(padded, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    integral_sq = np.pad(padded * padded, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    ys = np.arange(0, h, block)[:, None]
+    xs = np.arange(0, w, block)[None, :]
+
+    def window_sums(table, dy, dx):
+        y0, x0 = ys + dy, xs + dx
+        return table[y0 + block, x0 + block] - table[y0, x0 + block] - table[y0 + block, x0] + table[y0, x0]
+
+    best = np.full(sum_a.shape, np.inf)
+    for dy in range(2 * search + 1):
+        for dx in range(2 * search + 1):
+            sum_b = window_sums(integral, dy, dx)
+            var_b = window_sums(integral_sq, dy, dx) - sum_b * sum_b / n
+            cov = _block_sums(a * padded[dy:dy + h, dx:dx + w], block) - sum_a * sum_b / n
+            rho = np.clip(cov / np.sqrt(np.maximum(var_a * var_b, 1e-12)), 0, 1)
+            np.minimum(best, (var_a + var_b) * (1 - rho * rho) / n, out=best)
+    return best * 1000, var_a / n * 1000
+
+def page_matches(image_a, image_b):
+    import numpy as np
+    aspect_a = image_a.height / image_a.width
+    aspect_b = image_b.height / image_b.width
+    if abs(aspect_a - aspect_b) > VERIFY_MAX_ASPECT_DIFF * aspect_a:
+        return False
+    residuals, ink_variance = page_residuals(image_a, image_b)
+    worst = float(residuals.max())
+    if worst > VERIFY_MAX_RESIDUAL:
+        return False
+    # Typical residual of the blocks that actually carry text
+    text = ink_variance > np.percentile(ink_variance, 50)
+    typical = float(np.percentile(residuals[text], 90)) if text.any() else 0.0
+    return worst <= VERIFY_MAX_RATIO * (typical + 0.5)
+
+def pages_match(preview_paths_a, preview_paths_b):
+    from PIL import Image
+    if len(preview_paths_a) != len(preview_paths_b):
+        return False
+    for path_a, path_b in zip(preview_paths_a, preview_paths_b):
+        with Image.open(path_a) as image_a, Image.open(path_b) as image_b:
+            if not page_matches(image_a, image_b):
+                return False
+    return True
+
+def manifests_match(cache, manifest_a, manifest_b, preview_dir):
+    # Verdicts are keyed by content digest, so each pair of files is compared once
+    if manifest_a['digest'] == manifest_b['digest']:
+        return True
+    digest_a, digest_b = sorted([manifest_a['digest'], manifest_b['digest']])
+    verdict_key = f"phash:verified:{digest_a}:{digest_b}"
+    verdict = cache.get(verdict_key)
+    if verdict is not None:
+        return verdict == b'1'
+    if manifest_a['digest'] != digest_a:
+        manifest_a, manifest_b = manifest_b, manifest_a
+    try:
+        matched = pages_match(
+            [os.path.join(preview_dir, page['preview']) for page in manifest_a['pages']],
+            [os.path.join(preview_dir, page['preview']) for page in manifest_b['pages']],
+        )
+    except Exception as e:
+        logging.error(f"Preview comparison failed for {digest_a} and {digest_b}: {e}")
+        return False
+    cache.set(verdict_key, '1' if matched else '0')
+    return matched
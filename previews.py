@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import logging
+from dedup import phash, format_hash
+
+PREVIEW_MAX_SIZE = (1600, 1600)
+THUMBNAIL_MAX_SIZE = (256, 256)
+
+def preview_format():
+    from PIL import features
+    # WebP is much smaller for scanned pages; fall back to PNG if Pillow was built without it
+    if features.check('webp'):
+        return 'webp', 'WEBP', {'quality': 80, 'method': 4}
+    return 'png', 'PNG', {'optimize': True}
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def preview_name(digest, page, ext, thumb=False):
+    suffix = '_thumb' if thumb else ''
+    return f"{digest}_p{page}{suffix}.{ext}"
+
+def _manifest_path(preview_dir, digest):
+    return os.path.join(preview_dir, f"{digest}.json")
+
+def _save_atomic(img, path, fmt, options):
+    tmp_path = path + '.tmp'
+    img.save(tmp_path, fmt, **options)
+    os.replace(tmp_path, path)
+
+HIGH_DEPTH_MODES = ('I;16', 'I;16B', 'I;16L', 'I', 'F')
+
+def _to_8bit(frame):
+    # convert('L') clamps 16-bit/int/float pixels rather than scaling them, so
+    # stretch the frame's own range onto 0-255 first
+    img = frame.convert('F')
+    lo, hi = img.getextrema()
+    if hi > lo:
+        img = img.point(lambda v: (v - lo) * (255.0 / (hi - lo)))
+    elif frame.mode.startswith('I;16'):
+        # Flat page: keep its nominal gray level
+        img = img.point(lambda v: v * (255.0 / 65535))
+    return img.convert('L')
+
+def _web_safe(frame):
+    # Scans come in as 1-bit, 16-bit grayscale, CMYK, etc.; normalize to something WebP/PNG can hold
+    if frame.mode in ('RGB', 'RGBA', 'L', 'LA'):
+        return frame.copy()
+    if frame.mode == 'P' or 'A' in frame.getbands():
+        return frame.convert('RGBA')
+    if frame.mode in HIGH_DEPTH_MODES:
+        return _to_8bit(frame)
+    if frame.mode == '1':
+        return frame.convert('L')
+    return frame.convert('RGB')
+
+def load_manifest(preview_dir, digest):
+    try:
+        with open(_manifest_path(preview_dir, digest)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Renders a downscaled preview and thumbnail per page, keyed by content hash so
+# re-uploads of identical bytes under another name reuse the existing files
+def build_previews(filepath, preview_dir, digest=None):
+    if digest is None:
+        digest = file_digest(filepath)
+    manifest = load_manifest(preview_dir, digest)
+    if manifest:
+        return manifest
+    from PIL import Image, ImageSequence
+    os.makedirs(preview_dir, exist_ok=True)
+    ext, fmt, options = preview_format()
+    pages = []
+    fingerprints = []
+    with Image.open(filepath) as img:
+        for page, frame in enumerate(ImageSequence.Iterator(img)):
+            rendition = _web_safe(frame)
+            rendition.thumbnail(PREVIEW_MAX_SIZE)
+            preview_file = preview_name(digest, page, ext)
+            _save_atomic(rendition, os.path.join(preview_dir, preview_file), fmt, options)
+            rendition.thumbnail(THUMBNAIL_MAX_SIZE)
+            thumb_file = preview_name(digest, page, ext, thumb=True)
+            _save_atomic(rendition, os.path.join(preview_dir, thumb_file), fmt, options)
+            pages.append({'preview': preview_file, 'thumbnail': thumb_file})
+            # Perceptual hash of the normalized thumbnail, for near-duplicate lookups
+            fingerprints.append(format_hash(phash(rendition)))
+    manifest = {'digest': digest, 'format': ext, 'pages': pages, 'phashes': fingerprints}
+    tmp_path = _manifest_path(preview_dir, digest) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, _manifest_path(preview_dir, digest))
+    return manifest
+
+def sidecar_path(filepath):
+    # Not an allowed upload extension, so it never shows up in the document lists
+    return filepath + '.preview.json'
+
+def _load_entry(filepath, stat, cache, cache_key):
+    cached = cache.get(cache_key)
+    if cached:
+        entry = json.loads(cached)
+    else:
+        try:
+            with open(sidecar_path(filepath)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+    if entry.get('size') != stat.st_size or entry.get('mtime') != stat.st_mtime_ns:
+        return None
+    if not cached:
+        cache.set(cache_key, json.dumps(entry))
+    return entry
+
+def _save_entry(filepath, entry, cache, cache_key):
+    cache.set(cache_key, json.dumps(entry))
+    try:
+        tmp_path = sidecar_path(filepath) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, sidecar_path(filepath))
+    except OSError as e:
+        logging.error(f"Could not write preview sidecar for {filepath}: {e}")
+
+def is_inside(filepath, directory):
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([os.path.realpath(filepath), directory]) == directory
+
+# The path -> digest mapping (or a failed render) is kept in the cache and in a
+# sidecar next to the upload, validated against size and mtime, so listing
+# documents never re-hashes or decodes the originals, even after a restart.
+# Only files inside upload_dir are read, and only there are sidecars written.
+# With build=False nothing is decoded: None means not rendered (yet) or failed.
+def get_previews(filepath, preview_dir, cache, upload_dir, build=True):
+    if not is_inside(filepath, upload_dir):
+        logging.error(f"Refusing previews for {filepath}: outside {upload_dir}")
+        return None
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    cache_key = f"preview:{os.path.abspath(filepath)}"
+    entry = _load_entry(filepath, stat, cache, cache_key)
+    if entry:
+        if entry.get('error'):
+            return None
+        manifest = load_manifest(preview_dir, entry['digest'])
+        if manifest:
+            return manifest
+    if not build:
+        return None
+    try:
+        manifest = build_previews(filepath, preview_dir, digest=entry['digest'] if entry else None)
+    except Exception as e:
+        logging.error(f"Preview generation failed for {filepath}: {e}")
+        _save_entry(filepath, {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'error': str(e)}, cache, cache_key)
+        return None
+    _save_entry(filepath, {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': manifest['digest']}, cache, cache_key)
+    return manifest
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The app is a flat set of modules rather than a package; make them importable from tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client(tmp_path):
+    # Test client with an established session id 'sid', and the app's cache
+    import app as app_module
+    flask_app = app_module.create_app({'UPLOAD_FOLDER': str(tmp_path / 'u'), 'PREVIEW_FOLDER': str(tmp_path / 'p')})
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['session_id'] = 'sid'
+    with flask_app.app_context():
+        yield client, app_module.get_cache()
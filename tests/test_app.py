@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(code):
+    # Fresh interpreter, so modules imported by other tests don't leak in
+    result = subprocess.run([sys.executable, '-c', textwrap.dedent(code)], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_import_utils_loads_no_heavy_modules():
+    _run('''
+        import sys
+        import utils
+        heavy = [m for m in ('flask', 'requests', 'PIL', 'opentelemetry.sdk') if m in sys.modules]
+        assert not heavy, heavy
+    ''')
+
+
+def test_import_app_creates_no_backends(tmp_path):
+    _run(f'''
+        import sys
+        import app
+        assert 'opentelemetry.sdk' not in sys.modules
+        assert 'fakeredis' not in sys.modules
+        assert app._tracer is None
+        flask_app = app.create_app({{'UPLOAD_FOLDER': {str(tmp_path / 'u')!r}, 'PREVIEW_FOLDER': {str(tmp_path / 'p')!r}}})
+        assert 'redis_cache' not in flask_app.extensions
+        assert 'opentelemetry.sdk' not in sys.modules
+        assert app._tracer is None
+    ''')
+
+
+def test_module_app_is_created_once(tmp_path):
+    _run(f'''
+        import threading, time
+        import app
+        real_create_app = app.create_app
+        created = []
+        def slow_create_app(config=None):
+            time.sleep(0.2)
+            created.append(real_create_app({{'UPLOAD_FOLDER': {str(tmp_path / 'u')!r}, 'PREVIEW_FOLDER': {str(tmp_path / 'p')!r}}}))
+            return created[-1]
+        app.create_app = slow_create_app
+        seen = []
+        threads = [threading.Thread(target=lambda: seen.append(app.app)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(created) == 1, created
+        assert all(a is created[0] for a in seen)
+    ''')
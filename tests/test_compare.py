@@ -0,0 +1,93 @@
+import json
+
+from utils import parse_markdown_table, diff_fields
+
+TABLE = """Here is what I found:
+
+| Field | Value |
+|-------|-------|
+| **Patient ID** | 12345 |
+| Date | 2024-01-02 |
+
+Some trailing prose.
+"""
+
+
+def test_parse_skips_header_and_separator_rows():
+    assert parse_markdown_table(TABLE) == [('Patient ID', '12345'), ('Date', '2024-01-02')]
+
+
+def test_parse_handles_separator_with_alignment_and_spaces():
+    text = "| Field | Value |\n| :--- | ---: |\n| Lab ID | A1 |"
+    assert parse_markdown_table(text) == [('Lab ID', 'A1')]
+
+
+def test_parse_numbers_duplicate_fields():
+    text = "| Field | Value |\n|---|---|\n| Result | 4.2 |\n| Result | 5.1 |\n| Result | 6.0 |"
+    assert parse_markdown_table(text) == [('Result', '4.2'), ('Result (2)', '5.1'), ('Result (3)', '6.0')]
+
+
+def test_parse_joins_extra_columns_into_value():
+    text = "| Test | Result | Range |\n|---|---|---|\n| Glucose | 90 | 70-100 |"
+    assert parse_markdown_table(text) == [('Glucose', '90 | 70-100')]
+
+
+def test_parse_without_tables_is_empty():
+    assert parse_markdown_table('No table here.') == []
+    assert parse_markdown_table(None) == []
+
+
+def test_diff_statuses():
+    left = "| Field | Value |\n|---|---|\n| Patient ID | 12 |\n| Date | 1/1 |\n| Lab | A |"
+    right = "| Field | Value |\n|---|---|\n| Patient ID | 12 |\n| Date | 1/2 |\n| Doctor | X |"
+    assert diff_fields(left, right) == [
+        {'field': 'Patient ID', 'left': '12', 'right': '12', 'status': 'same'},
+        {'field': 'Date', 'left': '1/1', 'right': '1/2', 'status': 'changed'},
+        {'field': 'Lab', 'left': 'A', 'right': None, 'status': 'left_only'},
+        {'field': 'Doctor', 'left': None, 'right': 'X', 'status': 'right_only'},
+    ]
+
+
+def test_diff_ignores_case_and_whitespace():
+    left = "| Field | Value |\n|---|---|\n| Name | John  Smith |"
+    right = "| Field | Value |\n|---|---|\n| Name | john smith |"
+    assert diff_fields(left, right)[0]['status'] == 'same'
+
+
+def _store(cache, key, value):
+    cache.set(key, json.dumps({'response': f"| Field | Value |\n|---|---|\n| Name | {value} |"}))
+
+
+def test_compare_returns_diff(client):
+    client, cache = client
+    _store(cache, 'sid:a.png::x', 'John')
+    _store(cache, 'sid:a.png::y', 'Jon')
+    r = client.get('/compare?left=sid:a.png::x&right=sid:a.png::y')
+    assert r.status_code == 200
+    assert r.json['diff'] == [{'field': 'Name', 'left': 'John', 'right': 'Jon', 'status': 'changed'}]
+
+
+def test_compare_diff_follows_replaced_results(client):
+    client, cache = client
+    _store(cache, 'sid:a.png::x', 'John')
+    _store(cache, 'sid:a.png::y', 'Jon')
+    client.get('/compare?left=sid:a.png::x&right=sid:a.png::y')
+    _store(cache, 'sid:a.png::y', 'John')
+    r = client.get('/compare?left=sid:a.png::x&right=sid:a.png::y')
+    assert r.json['diff'][0]['status'] == 'same'
+
+
+def test_compare_rejects_other_sessions(client):
+    client, cache = client
+    _store(cache, 'other:a.png::x', 'John')
+    _store(cache, 'sid:a.png::y', 'Jon')
+    assert client.get('/compare?left=other:a.png::x&right=sid:a.png::y').status_code == 404
+
+
+def test_compare_diffs_expire(client):
+    client, cache = client
+    _store(cache, 'sid:a.png::x', 'John')
+    _store(cache, 'sid:a.png::y', 'Jon')
+    client.get('/compare?left=sid:a.png::x&right=sid:a.png::y')
+    [diff_key] = cache.keys('compare:*')
+    assert 0 < cache.ttl(diff_key) <= 3600
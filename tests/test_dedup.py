@@ -0,0 +1,174 @@
+import io
+import os
+import json
+import random
+
+import fakeredis
+import pytest
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+import app as app_module
+from dedup import (phash, hamming_distance, is_informative, index_document, find_near_duplicates,
+                   page_matches, NEAR_DUPLICATE_DISTANCE, VERIFY_MAX_CANDIDATES)
+
+
+def invoice(name, amount):
+    img = Image.new('L', (1700, 2200), 255)
+    d = ImageDraw.Draw(img)
+    big, font = ImageFont.load_default(size=64), ImageFont.load_default(size=36)
+    d.text((120, 100), 'INVOICE', font=big, fill=0)
+    d.rectangle([100, 250, 1600, 700], outline=0, width=4)
+    for i, (label, value) in enumerate([('Bill to:', name), ('Amount due:', amount),
+                                        ('Invoice date:', '2024-03-01'), ('Account:', 'ACCT-0042')]):
+        d.text((140, 290 + i * 100), label, font=font, fill=0)
+        d.text((520, 290 + i * 100), value, font=font, fill=0)
+        d.line([500, 335 + i * 100, 1550, 335 + i * 100], fill=0, width=2)
+    for row in range(10):
+        d.line([100, 800 + row * 100, 1600, 800 + row * 100], fill=0, width=2)
+    d.text((140, 1900), 'Thank you for your business. Payment due in 30 days.', font=font, fill=0)
+    return img
+
+
+def rescan(img, angle=0.3, shift=(6, -4), scale=0.8):
+    # Slightly rotated, shifted, downsampled, blurred and speckled
+    r = random.Random(0)
+    out = img.rotate(angle, resample=Image.BICUBIC, fillcolor=255, translate=shift)
+    out = out.resize((int(out.width * scale), int(out.height * scale)), Image.LANCZOS)
+    out = out.filter(ImageFilter.GaussianBlur(1.2))
+    px = out.load()
+    for _ in range(out.width * out.height // 200):
+        px[r.randrange(out.width), r.randrange(out.height)] = r.randrange(256)
+    return out
+
+
+@pytest.fixture(scope='module')
+def original():
+    return invoice('John Smith', '$1,234.00')
+
+
+def test_filled_copies_hash_alike(original):
+    # Why the hash alone can't justify reuse
+    other = invoice('Alice Wong', '$98.10')
+    assert hamming_distance(phash(original), phash(other)) <= NEAR_DUPLICATE_DISTANCE
+
+
+def test_rescan_matches(original):
+    assert hamming_distance(phash(original), phash(rescan(original))) <= NEAR_DUPLICATE_DISTANCE
+    assert page_matches(original, rescan(original))
+
+
+def test_different_filled_copy_does_not_match(original):
+    assert not page_matches(original, invoice('Alice Wong', '$98.10'))
+    assert not page_matches(original, rescan(invoice('Alice Wong', '$98.10')))
+    assert not page_matches(original, rescan(invoice('John Smith', '$9,999.99')))
+
+
+def test_blank_pages_are_not_indexed():
+    cache = fakeredis.FakeStrictRedis()
+    blank = phash(Image.new('L', (850, 1100), 250))
+    assert blank == 0
+    assert not is_informative(blank)
+    assert not is_informative((1 << 64) - 1)
+    index_document(cache, 'a.png', [blank])
+    index_document(cache, 'b.png', [blank])
+    assert find_near_duplicates(cache, [blank], exclude='b.png') == []
+
+
+def test_index_finds_hashes_within_distance():
+    cache = fakeredis.FakeStrictRedis()
+    value = 0x5A5A_F00F_3C3C_9669
+    near = value ^ 0b1011_0000_0000_0001_0000_0100_0000_0000_0000_1000_0000_0000_0100_0000_0000_0001
+    far = value ^ 0xFFFF
+    index_document(cache, 'near.png', [near])
+    index_document(cache, 'far.png', [far])
+    assert find_near_duplicates(cache, [value]) == [(hamming_distance(value, near), 'near.png')]
+
+
+def _upload(client, name, img):
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    buf.seek(0)
+    assert client.post('/', data={'file': (buf, name)}).status_code == 200
+
+
+def test_result_suggested_only_for_matching_pages(client, original):
+    client, cache = client
+    _upload(client, 'a.png', original)
+    _upload(client, 'rescan.png', rescan(original))
+    _upload(client, 'other.png', invoice('Alice Wong', '$98.10'))
+    cache.set('sid:a.png::ocr', json.dumps({'request': 'r', 'response': 'John Smith'}))
+    suggested = app_module.near_duplicate_result(cache, 'sid', 'rescan.png', 'ocr')
+    assert json.loads(suggested)['reused_from'] == 'a.png'
+    assert app_module.near_duplicate_result(cache, 'sid', 'other.png', 'ocr') is None
+
+
+def _process(client, filename, **form):
+    return client.post('/documents', data={'files': filename, 'combos': 'none', 'reuse_near_duplicates': 'on', **form})
+
+
+@pytest.mark.parametrize('name, amount', [
+    ('John Smith', '$1,284.00'),
+    ('John Smith', '$1,234.09'),
+    ('John Smith', '$7,234.00'),
+    ('John Smyth', '$1,234.00'),
+])
+def test_one_character_change_on_rescan_is_never_reused(client, original, name, amount):
+    # These can pass the page comparison; the copied result must wait for confirmation
+    client, cache = client
+    _upload(client, 'a.png', original)
+    _upload(client, 'b.png', rescan(invoice(name, amount)))
+    cache.set('sid:a.png::none', json.dumps({'request': 'r', 'response': 'John Smith $1,234.00'}))
+    r = _process(client, 'b.png')
+    assert r.status_code == 200
+    stored = cache.get('sid:b.png::none')
+    assert stored is None or json.loads(stored)['response'] != 'John Smith $1,234.00'
+
+
+def test_confirmed_suggestion_is_kept(client, original):
+    client, cache = client
+    _upload(client, 'a.png', original)
+    _upload(client, 'b.png', rescan(original))
+    cache.set('sid:a.png::none', json.dumps({'request': 'r', 'response': 'John Smith $1,234.00'}))
+    r = _process(client, 'b.png')
+    assert b'Suggested Result' in r.data
+    assert cache.get('sid:b.png::none') is None
+    # Another session cannot confirm it
+    _process(client, 'b.png', confirm='other:b.png::none')
+    assert cache.get('sid:b.png::none') is None
+    r = _process(client, 'b.png', confirm='sid:b.png::none')
+    assert b'Confirmed copy' in r.data
+    assert json.loads(cache.get('sid:b.png::none'))['reused_from'] == 'a.png'
+
+
+def test_compare_post_does_not_fingerprint(client, monkeypatch):
+    client, cache = client
+    calls = []
+    monkeypatch.setattr(app_module, 'document_fingerprints', calls.append)
+    client.post('/documents', data={'files': 'a.png', 'combos': '', 'left_select': '', 'right_select': ''})
+    assert calls == []
+
+
+def test_documents_ignores_paths_outside_uploads(client, tmp_path):
+    client, cache = client
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    Image.new('L', (300, 400), 200).save(outside / 'x.png')
+    for form in ({'files': '../outside/x.png', 'combos': 'none'},
+                 {'files': '../outside/x.png', 'combos': 'none', 'left_select': '', 'right_select': ''}):
+        r = client.post('/documents', data={**form, 'reuse_near_duplicates': 'on'})
+        assert r.status_code == 200
+        assert b'../outside/x.png - none' not in r.data
+    assert os.listdir(outside) == ['x.png']
+    assert cache.keys('*outside*') == []
+
+
+def test_page_comparisons_are_capped_per_lookup(client, monkeypatch):
+    client, cache = client
+    for i in range(6):
+        index_document(cache, f'{i}.png', [0x5A5A_F00F_3C3C_9669])
+        cache.set(f'sid:{i}.png::ocr', json.dumps({'response': 'x'}))
+    compared = []
+    monkeypatch.setattr(app_module, 'document_manifest', lambda filename: {'digest': filename, 'pages': []})
+    monkeypatch.setattr(app_module, 'manifests_match', lambda cache, a, b, preview_dir: compared.append(b) and False)
+    assert app_module.near_duplicate_result(cache, 'sid', '0.png', 'ocr') is None
+    assert len(compared) == VERIFY_MAX_CANDIDATES
@@ -0,0 +1,114 @@
+import os
+import time
+
+import fakeredis
+import pytest
+from PIL import Image
+
+import previews
+from previews import build_previews, get_previews, sidecar_path
+
+
+@pytest.fixture
+def cache():
+    return fakeredis.FakeStrictRedis()
+
+
+def _open_preview(preview_dir, manifest, page=0):
+    return Image.open(os.path.join(preview_dir, manifest['pages'][page]['preview']))
+
+
+def test_16bit_flat_page_keeps_its_gray_level(tmp_path):
+    path = tmp_path / 'scan.tif'
+    Image.new('I;16', (300, 400), 40000).save(path)
+    manifest = build_previews(str(path), str(tmp_path / 'previews'))
+    with _open_preview(str(tmp_path / 'previews'), manifest) as img:
+        lo, hi = img.convert('L').getextrema()
+    assert abs(lo - 40000 * 255 / 65535) <= 2
+    assert abs(hi - 40000 * 255 / 65535) <= 2
+
+
+def test_16bit_page_is_rescaled_not_clamped(tmp_path):
+    path = tmp_path / 'scan.tif'
+    img = Image.new('I;16', (300, 400), 60000)
+    img.paste(10000, (50, 50, 250, 150))
+    img.save(path)
+    manifest = build_previews(str(path), str(tmp_path / 'previews'))
+    with _open_preview(str(tmp_path / 'previews'), manifest) as preview:
+        lo, hi = preview.convert('L').getextrema()
+    assert lo <= 5
+    assert hi >= 250
+
+
+def test_multipage_tiff_gets_preview_per_page(tmp_path):
+    path = tmp_path / 'scan.tif'
+    frames = [Image.new('1', (800, 1000), 1), Image.new('L', (800, 1000), 128)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    manifest = build_previews(str(path), str(tmp_path / 'previews'))
+    assert len(manifest['pages']) == 2
+    with _open_preview(str(tmp_path / 'previews'), manifest, page=1) as preview:
+        assert max(preview.size) <= max(previews.PREVIEW_MAX_SIZE)
+
+
+def test_sidecar_avoids_rehashing_after_restart(tmp_path, cache, monkeypatch):
+    path = tmp_path / 'scan.png'
+    Image.new('L', (300, 400), 200).save(path)
+    preview_dir = str(tmp_path / 'previews')
+    manifest = get_previews(str(path), preview_dir, cache, str(tmp_path))
+    assert os.path.exists(sidecar_path(str(path)))
+
+    def fail(*args, **kwargs):
+        raise AssertionError('original was re-read')
+    monkeypatch.setattr(previews, 'file_digest', fail)
+    monkeypatch.setattr(previews, 'build_previews', fail)
+    # A fresh cache stands in for a new worker process
+    assert get_previews(str(path), preview_dir, fakeredis.FakeStrictRedis(), str(tmp_path)) == manifest
+
+
+def test_sidecar_is_invalidated_when_file_changes(tmp_path, cache):
+    path = tmp_path / 'scan.png'
+    Image.new('L', (300, 400), 200).save(path)
+    preview_dir = str(tmp_path / 'previews')
+    first = get_previews(str(path), preview_dir, cache, str(tmp_path))
+    Image.new('L', (300, 400), 20).save(path)
+    os.utime(path, ns=(1, 1))
+    assert get_previews(str(path), preview_dir, cache, str(tmp_path))['digest'] != first['digest']
+
+
+def test_failed_render_is_not_retried(tmp_path, cache, monkeypatch):
+    path = tmp_path / 'broken.tif'
+    path.write_bytes(b'not an image')
+    preview_dir = str(tmp_path / 'previews')
+    assert get_previews(str(path), preview_dir, cache, str(tmp_path)) is None
+
+    calls = []
+    monkeypatch.setattr(previews, 'build_previews', lambda *a, **kw: calls.append(a))
+    assert get_previews(str(path), preview_dir, cache, str(tmp_path)) is None
+    assert get_previews(str(path), preview_dir, fakeredis.FakeStrictRedis(), str(tmp_path)) is None
+    assert calls == []
+
+
+def test_files_outside_upload_dir_are_refused(tmp_path, cache):
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (tmp_path / 'uploads').mkdir()
+    path = outside / 'scan.png'
+    Image.new('L', (300, 400), 200).save(path)
+    escaped = os.path.join(str(tmp_path / 'uploads'), '..', 'outside', 'scan.png')
+    assert get_previews(escaped, str(tmp_path / 'previews'), cache, str(tmp_path / 'uploads')) is None
+    assert not os.path.exists(sidecar_path(str(path)))
+    assert not os.path.exists(tmp_path / 'previews')
+
+
+def test_listing_renders_missing_previews_in_background(client, tmp_path):
+    client, cache = client
+    Image.new('L', (300, 400), 200).save(tmp_path / 'u' / 'old.png')
+    r = client.get('/documents')
+    assert r.status_code == 200
+    assert b'/previews/' not in r.data
+    for _ in range(100):
+        if os.path.exists(sidecar_path(str(tmp_path / 'u' / 'old.png'))):
+            break
+        time.sleep(0.05)
+    assert b'/previews/' in client.get('/documents').data
+    assert b'/previews/' in client.get('/').data
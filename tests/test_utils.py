@@ -0,0 +1,71 @@
+import base64
+import json
+import mmap
+import os
+
+import pytest
+
+from utils import Base64JSONBody, IMAGE_PLACEHOLDER
+
+PAYLOAD = {'model': 'm', 'prompt': 'Read "this" é', 'images': [IMAGE_PLACEHOLDER]}
+
+
+def _read_all(body, sizes=(-1,)):
+    # Reads with the given sizes in turn, repeating the last one until exhausted
+    out = bytearray()
+    sizes = list(sizes)
+    while True:
+        size = sizes.pop(0) if len(sizes) > 1 else sizes[0]
+        chunk = body.read(size)
+        if not chunk:
+            return bytes(out)
+        out += chunk
+
+
+@pytest.mark.parametrize('size', [0, 1, 2, 3, 4, 5, 6, 7, 11, 12, 13, 1000])
+def test_round_trip_and_length(size):
+    image = os.urandom(size)
+    body = Base64JSONBody(PAYLOAD, image, chunk_size=6)
+    data = _read_all(body)
+    assert len(body) == len(data)
+    decoded = json.loads(data)
+    assert decoded['prompt'] == PAYLOAD['prompt']
+    assert base64.b64decode(decoded['images'][0]) == image
+
+
+@pytest.mark.parametrize('sizes', [(1,), (7,), (5, 1, 64, 2), (3, -1)])
+def test_mixed_read_sizes(sizes):
+    image = os.urandom(100)
+    data = _read_all(Base64JSONBody(PAYLOAD, image, chunk_size=9), sizes)
+    assert base64.b64decode(json.loads(data)['images'][0]) == image
+
+
+def test_iteration_matches_read():
+    image = os.urandom(50)
+    body = Base64JSONBody(PAYLOAD, image, chunk_size=9)
+    first = body.read(10)
+    data = first + b''.join(body)
+    assert len(body) == len(data)
+    assert base64.b64decode(json.loads(data)['images'][0]) == image
+
+
+def test_length_matches_for_path_bytes_and_mmap(tmp_path):
+    image = os.urandom(3 * 1024 + 2)
+    path = tmp_path / 'img.png'
+    path.write_bytes(image)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for source in (str(path), path, image, mapped):
+            body = Base64JSONBody(PAYLOAD, source, chunk_size=1024)
+            data = _read_all(body, (700,))
+            body.close()
+            assert len(body) == len(data)
+            assert base64.b64decode(json.loads(data)['images'][0]) == image
+
+
+@pytest.mark.parametrize('payload', [
+    {'images': []},
+    {'images': [IMAGE_PLACEHOLDER, IMAGE_PLACEHOLDER]},
+])
+def test_placeholder_must_appear_once(payload):
+    with pytest.raises(ValueError):
+        Base64JSONBody(payload, b'abc')
@@ -1,11 +1,22 @@
 import os
 import base64
-import requests
-from PIL import Image
-import pytesseract
 import mimetypes
 import logging
 import json
+import threading
+
+# requests, PIL and pytesseract are imported inside the helpers that need them so
+# batch jobs importing this module do not pay for them (or for Flask/tracing) up front
+
+_http = threading.local()
+
+def get_http_session():
+    # One requests.Session per thread, created on first use, so connections to Ollama/Gemini are reused
+    session = getattr(_http, 'session', None)
+    if session is None:
+        import requests
+        session = _http.session = requests.Session()
+    return session
 
 def allowed_file(filename, allowed_extensions=None):
     if allowed_extensions is None:
@@ -13,17 +24,100 @@ def allowed_file(filename, allowed_extensions=None):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+# Marks where Base64JSONBody splices the encoded image into the JSON payload
+IMAGE_PLACEHOLDER = '__IMAGE_BASE64__'
+
+# Raw bytes per base64 step; a multiple of 3 so chunks encode without padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+class Base64JSONBody:
+    # File-like JSON request body that base64-encodes the image while it is sent.
+    # Only one chunk of the image is held in memory at a time, instead of the raw
+    # bytes plus a base64 str plus the serialized JSON plus its encoded bytes.
+    # image_source is a file path (read in chunks) or any buffer (bytes, mmap, memoryview).
+    def __init__(self, payload, image_source, chunk_size=BASE64_CHUNK_SIZE):
+        body = json.dumps(payload)
+        if body.count(IMAGE_PLACEHOLDER) != 1:
+            raise ValueError('payload must contain IMAGE_PLACEHOLDER exactly once')
+        prefix, suffix = body.split(IMAGE_PLACEHOLDER)
+        self._prefix = prefix.encode('utf-8')
+        self._suffix = suffix.encode('utf-8')
+        self._chunk_size = chunk_size - chunk_size % 3 or 3
+        if isinstance(image_source, (str, os.PathLike)):
+            self._file = open(image_source, 'rb')
+            self._view = None
+            image_size = os.fstat(self._file.fileno()).st_size
+        else:
+            self._file = None
+            self._view = memoryview(image_source).cast('B')
+            image_size = len(self._view)
+        self._length = len(self._prefix) + 4 * ((image_size + 2) // 3) + len(self._suffix)
+        self._chunks = self._iter_chunks()
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return self._length
+
+    def _iter_image(self):
+        if self._file is not None:
+            with self._file:
+                for chunk in iter(lambda: self._file.read(self._chunk_size), b''):
+                    yield chunk
+        else:
+            for start in range(0, len(self._view), self._chunk_size):
+                yield self._view[start:start + self._chunk_size]
+
+    def _iter_chunks(self):
+        yield self._prefix
+        for chunk in self._iter_image():
+            yield base64.b64encode(chunk)
+        yield self._suffix
+
+    def __iter__(self):
+        if self._buffer:
+            yield bytes(self._buffer)
+            self._buffer.clear()
+        for chunk in self._chunks:
+            if chunk:
+                yield chunk
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self._chunks.close()
+        if self._file is not None:
+            self._file.close()
+        if self._view is not None:
+            # Let the caller close an mmap it passed in
+            self._view.release()
+
+def post_image_json(url, payload, image_source, headers=None, **kwargs):
+    # POSTs payload as JSON, streaming image_source base64-encoded in place of IMAGE_PLACEHOLDER
+    body = Base64JSONBody(payload, image_source)
+    headers = {**(headers or {}), 'Content-Type': 'application/json'}
+    try:
+        return get_http_session().post(url, data=body, headers=headers, **kwargs)
+    finally:
+        body.close()
+
 def run_llava_inference(image_path, ollama_api_url):
     try:
-        with open(image_path, 'rb') as img_file:
-            image_bytes = img_file.read()
-            image_b64 = base64.b64encode(image_bytes).decode('utf-8')
         data = {
             'model': 'llava:latest',
             'prompt': 'Describe the contents of this image.',
-            'image': image_b64
+            'image': IMAGE_PLACEHOLDER
         }
-        response = requests.post(ollama_api_url, json=data, stream=True)
+        response = post_image_json(ollama_api_url, data, image_path, stream=True)
         if response.ok:
             result = ''
             for line in response.iter_lines():
@@ -46,7 +140,7 @@ def run_text_llm_inference(text, model, ollama_api_url):
         'prompt': f'Analyze the following extracted text from an image and summarize or answer questions as appropriate.\n\n{text}'
     }
     try:
-        response = requests.post(ollama_api_url, json=data, stream=True)
+        response = get_http_session().post(ollama_api_url, json=data, stream=True)
         if response.ok:
             result = ''
             for line in response.iter_lines():
@@ -65,6 +159,8 @@ def run_text_llm_inference(text, model, ollama_api_url):
 
 def run_ocr(image_path):
     try:
+        from PIL import Image
+        import pytesseract
         image = Image.open(image_path)
         text = pytesseract.image_to_string(image)
         return text.strip()
@@ -74,6 +170,7 @@ def run_ocr(image_path):
 
 def convert_tiff_to_png(tiff_path):
     try:
+        from PIL import Image
         png_path = tiff_path.rsplit('.', 1)[0] + '_converted.png'
         with Image.open(tiff_path) as img:
             img.save(png_path, 'PNG')
@@ -84,4 +181,51 @@ def convert_tiff_to_png(tiff_path):
 
 def get_mime_type(filepath):
     mime_type, _ = mimetypes.guess_type(filepath)
-    return mime_type or 'image/png' 
\ No newline at end of file
+    return mime_type or 'image/png'
+
+def _clean_cell(cell):
+    return cell.strip().strip('*').strip()
+
+def parse_markdown_table(text):
+    # Collects (field, value) rows from every markdown table in an LLM response.
+    # The first column is the field; remaining columns are joined as the value.
+    rows = []
+    seen = {}
+    lines = [line.strip() for line in (text or '').splitlines()]
+    for i, line in enumerate(lines):
+        if not line.startswith('|'):
+            continue
+        cells = [_clean_cell(c) for c in line.strip('|').split('|')]
+        if all(set(c) <= set('-: ') for c in cells):
+            continue
+        # Skip header rows (the row directly above a |---|---| separator)
+        next_line = lines[i + 1] if i + 1 < len(lines) else ''
+        if next_line.startswith('|') and set(next_line) <= set('|-: '):
+            continue
+        field = cells[0]
+        if not field:
+            continue
+        value = ' | '.join(cells[1:])
+        seen[field] = seen.get(field, 0) + 1
+        if seen[field] > 1:
+            field = f"{field} ({seen[field]})"
+        rows.append((field, value))
+    return rows
+
+def _normalize_value(value):
+    return ' '.join(value.split()).casefold()
+
+def diff_fields(left_text, right_text):
+    left_rows = parse_markdown_table(left_text)
+    right_rows = dict(parse_markdown_table(right_text))
+    diff = []
+    for field, left_value in left_rows:
+        if field not in right_rows:
+            diff.append({'field': field, 'left': left_value, 'right': None, 'status': 'left_only'})
+            continue
+        right_value = right_rows.pop(field)
+        same = _normalize_value(left_value) == _normalize_value(right_value)
+        diff.append({'field': field, 'left': left_value, 'right': right_value, 'status': 'same' if same else 'changed'})
+    for field, right_value in right_rows.items():
+        diff.append({'field': field, 'left': None, 'right': right_value, 'status': 'right_only'})
+    return diff